@@ -0,0 +1,3 @@
+# test_supabase.py is a manual connection check against the live database,
+# not a pytest module
+collect_ignore = ["test_supabase.py"]
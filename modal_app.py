@@ -21,6 +21,7 @@ image = (
         "supabase",
         "python-dotenv"
     )
+    .env({"CHANGE_FEED_DIR": "/feed"})
     .add_local_dir("tools", remote_path="/root/tools")
 )
 
@@ -31,9 +32,14 @@ app = modal.App("ai-news-scraper")
 # modal secret create supabase-secret SUPABASE_URL=... SUPABASE_KEY=...
 supabase_secret = modal.Secret.from_name("supabase-secret")
 
+# The change feed (and sync cursor) must outlive each run, otherwise every
+# run would start from an empty log and re-sync everything
+feed_volume = modal.Volume.from_name("ai-news-change-feed", create_if_missing=True)
+
 @app.function(
     image=image,
     secrets=[supabase_secret],
+    volumes={"/feed": feed_volume},
     schedule=modal.Period(days=1),
     timeout=900  # 15 minutes timeout
 )
@@ -77,13 +83,14 @@ def run_daily_scrape():
             json.dump(ar_data, f)
             
         print("[Modal] Merging articles...")
-        merged_data = merge_articles() # This reads from .tmp and writes to .tmp/all_articles.json
+        merged_data = merge_articles() # This reads from .tmp and appends to the change feed
         
         # 4. Sync to Supabase
         from tools.sync_to_supabase import sync_articles
         print("[Modal] Syncing to Supabase...")
-        # sync_articles reads from .tmp/all_articles.json
+        # sync_articles reads changes since its cursor from the change feed
         sync_articles()
+        feed_volume.commit()
         
         print("[Modal] Daily scrape completed successfully!")
         
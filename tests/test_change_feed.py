@@ -0,0 +1,208 @@
+from tools import change_feed
+from tools.merge_articles import diff_against_state
+
+
+def _article(url, title="Title"):
+    return {"id": url, "title": title, "url": url, "source": "bens_bites"}
+
+
+def test_append_after_torn_record_keeps_next_record(tmp_path):
+    change_feed.append_changes(
+        [("insert", _article("u1")), ("insert", _article("u2"))], tmp_path)
+
+    # Simulate a crash mid-append
+    segment = change_feed._list_segments(tmp_path)[-1]
+    with open(segment, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 3, "op": "ins')
+
+    last = change_feed.append_changes(
+        [("insert", _article("u3")), ("insert", _article("u4"))], tmp_path)
+
+    changes, cursor = change_feed.changes_since(0, tmp_path)
+    assert [c["url"] for c in changes] == ["u1", "u2", "u3", "u4"]
+    assert [c["seq"] for c in changes] == [1, 2, 3, 4]
+    assert cursor == last == 4
+    assert set(change_feed.load_state(feed_dir=tmp_path)) == {"u1", "u2", "u3", "u4"}
+
+
+def test_changes_since_replays_snapshot_for_stale_cursor(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "SEGMENT_MAX_RECORDS", 1)
+    change_feed.append_changes(
+        [("insert", _article("u1")), ("insert", _article("u2")),
+         ("update", _article("u1", "Edited"))], tmp_path)
+    assert change_feed.compact(tmp_path, force=True)
+
+    changes, cursor = change_feed.changes_since(1, tmp_path)
+    assert cursor == 3
+    assert {c["url"] for c in changes} == {"u1", "u2"}
+
+    changes, cursor = change_feed.changes_since(3, tmp_path)
+    assert changes == [] and cursor == 3
+
+
+def test_diff_inserts_unseen_url_even_when_deduped():
+    article = _article("u1")
+    changes = diff_against_state([article], {"u1"}, {})
+    assert changes == [("insert", article)]
+
+
+def test_diff_records_edit_from_other_source_as_update():
+    prev = _article("u1", "A")
+    incoming = {"id": "new-id", "title": "A2 edited", "url": "u1",
+                "source": "ai_rundown", "summary": "new"}
+
+    changes = diff_against_state([incoming], set(), {"u1": prev})
+
+    assert [op for op, _ in changes] == ["update"]
+    record = changes[0][1]
+    assert record["title"] == "A2 edited" and record["summary"] == "new"
+    assert record["id"] == "u1" and record["source"] == "bens_bites"
+    # all_articles.json gets the same row as the feed
+    assert incoming == record
+
+
+def test_diff_gap_fill_from_other_source_is_merge():
+    prev = _article("u1", "A")
+    incoming = {"id": "new-id", "title": "A", "url": "u1",
+                "source": "ai_rundown", "summary": "filled"}
+
+    changes = diff_against_state([incoming], set(), {"u1": prev})
+
+    assert [op for op, _ in changes] == ["merge"]
+    assert changes[0][1]["summary"] == "filled"
+
+
+def test_record_failure_dead_letters_after_max_attempts(tmp_path):
+    change = {"seq": 7, "op": "insert", "url": "u1", "article": _article("u1")}
+
+    assert not change_feed.record_failure("sync", change, "boom", 3, tmp_path)
+    assert not change_feed.record_failure("sync", change, "boom", 3, tmp_path)
+    assert change_feed.record_failure("sync", change, "boom", 3, tmp_path)
+
+    with open(tmp_path / change_feed.DEAD_LETTER_FILE, encoding='utf-8') as f:
+        lines = f.readlines()
+    assert len(lines) == 1 and '"seq": 7' in lines[0]
+    # Counter starts over for a fresh failure of the same change
+    assert not change_feed.record_failure("sync", change, "boom", 3, tmp_path)
+    change_feed.clear_failures("sync", 7, tmp_path)
+    assert change_feed._load_json_file(tmp_path / change_feed.FAILURES_FILE) == {"sync": {}}
+
+
+def test_append_rolls_segments_across_calls(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "SEGMENT_MAX_RECORDS", 2)
+    change_feed.append_changes([("insert", _article("u1"))], tmp_path)
+    change_feed.append_changes(
+        [("insert", _article("u2")), ("insert", _article("u3"))], tmp_path)
+
+    names = [p.name for p in change_feed._list_segments(tmp_path)]
+    assert names == ["segment-000000000001.jsonl", "segment-000000000003.jsonl"]
+    assert change_feed.last_seq(tmp_path) == 3
+
+
+def test_append_after_torn_rollover_keeps_seq_increasing(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "SEGMENT_MAX_RECORDS", 2)
+    change_feed.append_changes(
+        [("insert", _article("u1")), ("insert", _article("u2"))], tmp_path)
+
+    # Crash right after rolling over: the new segment holds only a torn line
+    with open(tmp_path / change_feed._segment_name(3), 'w', encoding='utf-8') as f:
+        f.write('{"seq": 3, "op": "ins')
+
+    assert change_feed.append_changes([("insert", _article("u3"))], tmp_path) == 3
+    changes, _ = change_feed.changes_since(0, tmp_path)
+    assert [c["seq"] for c in changes] == [1, 2, 3]
+    assert [c["url"] for c in change_feed.changes_since(2, tmp_path)[0]] == ["u3"]
+
+
+def test_append_after_corrupt_complete_last_line(tmp_path):
+    change_feed.append_changes([("insert", _article("u1"))], tmp_path)
+    segment = change_feed._list_segments(tmp_path)[-1]
+    with open(segment, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 2, "op"\n')
+
+    assert change_feed.last_seq(tmp_path) == 1
+    assert change_feed.append_changes([("insert", _article("u2"))], tmp_path) == 2
+    changes, _ = change_feed.changes_since(0, tmp_path)
+    assert [(c["seq"], c["url"]) for c in changes] == [(1, "u1"), (2, "u2")]
+
+
+def test_load_state_looks_up_only_requested_urls(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "SEGMENT_MAX_RECORDS", 1)
+    change_feed.append_changes(
+        [("insert", _article("u1")), ("insert", _article("u2")),
+         ("update", _article("u1", "Edited")), ("insert", _article("u3"))], tmp_path)
+    assert change_feed.compact(tmp_path, force=True)
+    assert change_feed._snapshot_seq(tmp_path) == 3
+
+    state = change_feed.load_state(["u1", "u3", "missing"], tmp_path)
+    assert set(state) == {"u1", "u3"}
+    assert state["u1"]["title"] == "Edited"
+
+
+def test_compact_stops_at_lowest_consumer_cursor(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "SEGMENT_MAX_RECORDS", 1)
+    change_feed.append_changes(
+        [("insert", _article(f"u{i}")) for i in range(1, 5)], tmp_path)
+    change_feed.save_cursor("fast", 4, tmp_path)
+    change_feed.save_cursor("slow", 2, tmp_path)
+
+    assert change_feed.compact(tmp_path, force=True)
+    assert change_feed._snapshot_seq(tmp_path) == 2
+
+    # The slow consumer still gets only its delta, no snapshot replay
+    changes, cursor = change_feed.changes_since(2, tmp_path)
+    assert [c["url"] for c in changes] == ["u3", "u4"] and cursor == 4
+
+    assert not change_feed.compact(tmp_path, force=True)
+
+
+def _failing_on(*bad_urls):
+    applied = []
+
+    def apply(article):
+        if article["url"] in bad_urls:
+            raise RuntimeError("rejected")
+        applied.append(article["url"])
+    return apply, applied
+
+
+def test_consume_holds_cursor_at_first_failure(tmp_path):
+    change_feed.append_changes(
+        [("insert", _article(u)) for u in ("u1", "bad", "u3")], tmp_path)
+    apply, applied = _failing_on("bad")
+
+    result = change_feed.consume("sync", apply, 3, tmp_path)
+
+    assert applied == ["u1", "u3"]
+    assert result["errors"] == 1 and result["to_cursor"] == 1
+    assert change_feed.load_cursor("sync", tmp_path) == 1
+
+
+def test_consume_moves_past_dead_lettered_change(tmp_path):
+    change_feed.append_changes(
+        [("insert", _article(u)) for u in ("u1", "bad", "u3")], tmp_path)
+    apply, _ = _failing_on("bad")
+
+    for _ in range(2):
+        assert change_feed.consume("sync", apply, 3, tmp_path)["to_cursor"] == 1
+    result = change_feed.consume("sync", apply, 3, tmp_path)
+
+    assert result["dead_lettered"] == 1 and result["to_cursor"] == 3
+    assert change_feed._load_json_file(tmp_path / change_feed.FAILURES_FILE) == {"sync": {}}
+    assert change_feed.consume("sync", apply, 3, tmp_path)["changes"] == 0
+
+
+def test_consume_failure_during_snapshot_replay_keeps_cursor_below_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "SEGMENT_MAX_RECORDS", 1)
+    change_feed.append_changes(
+        [("insert", _article(u)) for u in ("u1", "u2", "u3")], tmp_path)
+    assert change_feed.compact(tmp_path, force=True)
+    apply, applied = _failing_on("u2")
+
+    result = change_feed.consume("sync", apply, 3, tmp_path)
+
+    # u1 and u2 share the snapshot seq 2, so the cursor must stay below it
+    assert applied == ["u1", "u3"]
+    assert result["to_cursor"] == 1
+    changes, _ = change_feed.changes_since(1, tmp_path)
+    assert {c["url"] for c in changes} >= {"u2"}
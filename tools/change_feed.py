@@ -0,0 +1,418 @@
+"""
+Change Feed
+Append-only, segmented log of article changes with sequence cursors.
+
+The merge stage appends one record per insert, update or dedup-merge.
+Consumers (sync, dashboard, ...) keep a cursor and read only the
+records after it via changes_since(), so per-run cost tracks the size
+of the delta rather than the size of the history.
+
+See architecture/change_feed.md for the on-disk format.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+FEED_DIR = Path(os.environ.get("CHANGE_FEED_DIR", ".tmp/changes"))
+SNAPSHOT_FILE = "snapshot.db"
+CURSORS_FILE = "cursors.json"
+FAILURES_FILE = "failures.json"
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+
+SEGMENT_MAX_RECORDS = 500      # Roll over to a new segment after this many records
+COMPACT_AFTER_SEGMENTS = 8     # Fold closed segments into the snapshot past this many
+
+OPS = ("insert", "update", "merge")
+
+def _segment_name(first_seq):
+    """Segment file name for a segment starting at first_seq"""
+    return f"{SEGMENT_PREFIX}{first_seq:012d}{SEGMENT_SUFFIX}"
+
+def _segment_first_seq(path):
+    """First sequence number of a segment, taken from its file name"""
+    return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+def _list_segments(feed_dir):
+    """Return segment paths ordered by their first sequence number"""
+    if not feed_dir.exists():
+        return []
+    return sorted(feed_dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+
+def _read_segment(path):
+    """Yield records from a segment, skipping a torn trailing line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-append can leave a partial last line
+                print(f"[feed] Skipping corrupt record in {path.name}")
+
+def _scan_tail(path, repair=False):
+    """
+    Return (last_seq, record_count) for a segment in one read.
+
+    Walks back from the end to the last line that parses. With
+    repair=True anything after it (a torn or corrupt tail) is truncated
+    so the next append starts on a fresh line. last_seq is None when the
+    segment holds no valid record.
+    """
+    with open(path, 'rb+' if repair else 'rb') as f:
+        data = f.read()
+        lines = data.split(b"\n")[:-1]  # last piece is torn or empty
+        seq = None
+        while lines:
+            line = lines[-1].strip()
+            if line:
+                try:
+                    seq = json.loads(line)["seq"]
+                    break
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                    print(f"[feed] Skipping corrupt record in {path.name}")
+            lines.pop()
+        keep = sum(len(line) + 1 for line in lines)
+        if repair and keep < len(data):
+            f.truncate(keep)
+            print(f"[feed] Dropped torn record at end of {path.name}")
+    return seq, sum(1 for line in lines if line.strip())
+
+def _write_json_atomic(path, data):
+    """Write JSON via a temp file so readers never see a partial file"""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _open_snapshot(feed_dir, create=False):
+    """
+    Open the compacted snapshot, or return None if there isn't one yet.
+
+    The snapshot is a SQLite file keyed by url, so readers can fetch its
+    seq or a handful of articles without loading the whole history.
+    """
+    path = feed_dir / SNAPSHOT_FILE
+    if not create and not path.exists():
+        return None
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS articles (url TEXT PRIMARY KEY, article TEXT)")
+    return conn
+
+def _snapshot_seq(feed_dir):
+    """Highest seq folded into the snapshot (0 if none)"""
+    conn = _open_snapshot(feed_dir)
+    if conn is None:
+        return 0
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+        return row[0] if row else 0
+    finally:
+        conn.close()
+
+def _snapshot_articles(feed_dir, urls=None):
+    """Yield (url, article) from the snapshot, all of it or just urls"""
+    conn = _open_snapshot(feed_dir)
+    if conn is None:
+        return
+    try:
+        if urls is None:
+            rows = conn.execute("SELECT url, article FROM articles ORDER BY url")
+            for url, article in rows:
+                yield url, json.loads(article)
+            return
+        urls = list(urls)
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT url, article FROM articles WHERE url IN ({placeholders})", chunk)
+            for url, article in rows:
+                yield url, json.loads(article)
+    finally:
+        conn.close()
+
+def last_seq(feed_dir=FEED_DIR):
+    """Return the highest sequence number written so far (0 if empty)"""
+    return _head(feed_dir)[1]
+
+def _head(feed_dir, repair=False):
+    """
+    Return (open_segment, last_seq, records_in_segment).
+
+    Reads only the open segment. If it holds no complete record (e.g. a
+    crash right after rollover), last_seq comes from its name, since the
+    previous closed segment may not be compacted yet. The snapshot is
+    consulted only when there are no segments at all.
+    """
+    segments = _list_segments(feed_dir)
+    if segments:
+        seq, count = _scan_tail(segments[-1], repair)
+        if seq is not None:
+            return segments[-1], seq, count
+        return segments[-1], _segment_first_seq(segments[-1]) - 1, 0
+    return None, _snapshot_seq(feed_dir), 0
+
+def load_state(urls=None, feed_dir=FEED_DIR):
+    """
+    Return the current {url: article} view from snapshot + segments.
+
+    Pass urls to look up just those articles; the snapshot is then read
+    by key, so the cost follows the batch rather than the history.
+    """
+    wanted = None if urls is None else set(urls)
+    floor = _snapshot_seq(feed_dir)
+    state = dict(_snapshot_articles(feed_dir, wanted))
+    for segment in _list_segments(feed_dir):
+        for record in _read_segment(segment):
+            if record["seq"] > floor and (wanted is None or record["url"] in wanted):
+                state[record["url"]] = record["article"]
+    return state
+
+def append_changes(changes, feed_dir=FEED_DIR):
+    """
+    Append changes to the log.
+
+    changes: list of (op, article) tuples, op in OPS.
+    Returns the sequence number of the last record written.
+    """
+    feed_dir.mkdir(parents=True, exist_ok=True)
+    segment, seq, records_in_segment = _head(feed_dir, repair=bool(changes))
+    if not changes:
+        return seq
+    if segment is None:
+        segment = feed_dir / _segment_name(seq + 1)
+
+    recorded_at = datetime.now().isoformat()
+    f = open(segment, 'a', encoding='utf-8')
+    try:
+        for op, article in changes:
+            if op not in OPS:
+                raise ValueError(f"Unknown change op: {op}")
+            seq += 1
+            if records_in_segment >= SEGMENT_MAX_RECORDS:
+                f.close()
+                segment = feed_dir / _segment_name(seq)
+                f = open(segment, 'a', encoding='utf-8')
+                records_in_segment = 0
+            record = {
+                "seq": seq,
+                "op": op,
+                "url": article["url"],
+                "recorded_at": recorded_at,
+                "article": article
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            records_in_segment += 1
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+
+    compact(feed_dir)
+    return seq
+
+def compact(feed_dir=FEED_DIR, force=False):
+    """
+    Fold closed segments into the snapshot and delete them.
+
+    The newest (open) segment is never compacted, nor is any segment
+    holding records a stored consumer cursor hasn't reached, so lagging
+    consumers keep reading deltas instead of a full snapshot replay.
+    Runs only once more than COMPACT_AFTER_SEGMENTS segments exist,
+    unless force=True.
+    """
+    segments = _list_segments(feed_dir)
+    if not force and len(segments) <= COMPACT_AFTER_SEGMENTS:
+        return False
+
+    cursors = _load_json_file(feed_dir / CURSORS_FILE)
+    closed = []
+    for segment, next_segment in zip(segments, segments[1:]):
+        segment_last_seq = _segment_first_seq(next_segment) - 1
+        if cursors and segment_last_seq > min(cursors.values()):
+            break
+        closed.append(segment)
+    if not closed:
+        return False
+
+    # One transaction: the snapshot moves to the new seq atomically, and
+    # must be durable before the segments it replaces go away
+    conn = _open_snapshot(feed_dir, create=True)
+    try:
+        with conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+            seq = row[0] if row else 0
+            for segment in closed:
+                for record in _read_segment(segment):
+                    if record["seq"] > seq:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO articles (url, article) VALUES (?, ?)",
+                            (record["url"], json.dumps(record["article"], ensure_ascii=False)))
+                        seq = record["seq"]
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seq', ?)", (seq,))
+    finally:
+        conn.close()
+    for segment in closed:
+        segment.unlink()
+
+    print(f"[feed] Compacted {len(closed)} segments up to seq {seq}")
+    return True
+
+def changes_since(cursor, feed_dir=FEED_DIR):
+    """
+    Return (changes, next_cursor) for all records with seq > cursor.
+
+    If cursor falls inside the compacted range, the snapshot is replayed
+    first as "insert" records stamped with the snapshot seq; consumers that
+    upsert by url end up in the same state either way.
+    """
+    snapshot_seq = _snapshot_seq(feed_dir)
+    changes = []
+
+    # Articles are only read when the cursor is behind the snapshot
+    if cursor < snapshot_seq:
+        for url, article in _snapshot_articles(feed_dir):
+            changes.append({
+                "seq": snapshot_seq,
+                "op": "insert",
+                "url": url,
+                "article": article
+            })
+
+    floor = max(cursor, snapshot_seq)
+    for segment in _list_segments(feed_dir):
+        for record in _read_segment(segment):
+            if record["seq"] > floor:
+                changes.append(record)
+
+    next_cursor = changes[-1]["seq"] if changes else cursor
+    return changes, next_cursor
+
+def load_cursor(consumer, feed_dir=FEED_DIR):
+    """Return the stored cursor for a consumer (0 if it has never read)"""
+    try:
+        with open(feed_dir / CURSORS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get(consumer, 0)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+
+def save_cursor(consumer, cursor, feed_dir=FEED_DIR):
+    """Persist a consumer's cursor"""
+    feed_dir.mkdir(parents=True, exist_ok=True)
+    path = feed_dir / CURSORS_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cursors = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cursors = {}
+    cursors[consumer] = cursor
+    _write_json_atomic(path, cursors)
+
+def _load_json_file(path):
+    """Load a small JSON bookkeeping file, empty dict if missing or corrupt"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def record_failure(consumer, change, error, max_attempts, feed_dir=FEED_DIR):
+    """
+    Count a failed attempt to apply a change.
+
+    Once a change has failed max_attempts times it is appended to the
+    dead-letter file and True is returned; the consumer should then move
+    its cursor past it so one bad article cannot stall the feed.
+    """
+    feed_dir.mkdir(parents=True, exist_ok=True)
+    path = feed_dir / FAILURES_FILE
+    failures = _load_json_file(path)
+    key = f"{change['seq']} {change['url']}"
+    attempts = failures.setdefault(consumer, {}).get(key, 0) + 1
+
+    if attempts < max_attempts:
+        failures[consumer][key] = attempts
+        _write_json_atomic(path, failures)
+        return False
+
+    failures[consumer].pop(key, None)
+    _write_json_atomic(path, failures)
+    entry = {
+        "consumer": consumer,
+        "attempts": attempts,
+        "error": str(error),
+        "dead_lettered_at": datetime.now().isoformat(),
+        "change": change
+    }
+    with open(feed_dir / DEAD_LETTER_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return True
+
+def clear_failures(consumer, cursor, feed_dir=FEED_DIR):
+    """Forget failure counts for changes at or below a consumer's cursor"""
+    path = feed_dir / FAILURES_FILE
+    failures = _load_json_file(path)
+    pending = failures.get(consumer, {})
+    kept = {k: v for k, v in pending.items() if int(k.split(" ", 1)[0]) > cursor}
+    if kept != pending:
+        failures[consumer] = kept
+        _write_json_atomic(path, failures)
+
+def consume(consumer, apply, max_attempts, feed_dir=FEED_DIR):
+    """
+    Apply every change since a consumer's cursor and advance the cursor.
+
+    apply(article) is called once per change and should raise on failure.
+    The cursor stops just before the first failing change so it is retried
+    next run, unless that change has now failed max_attempts times, in
+    which case it is dead-lettered and skipped. Returns a stats dict.
+    """
+    cursor = load_cursor(consumer, feed_dir)
+    changes, head = changes_since(cursor, feed_dir)
+    result = {
+        "changes": len(changes),
+        "applied": 0,
+        "errors": 0,
+        "dead_lettered": 0,
+        "from_cursor": cursor,
+        "to_cursor": cursor,
+        "head": head
+    }
+    if not changes:
+        return result
+
+    blocked = False
+    for change in changes:
+        try:
+            apply(change["article"])
+            result["applied"] += 1
+        except Exception as e:
+            print(f"[feed] {consumer}: error applying {change['url']}: {e}")
+            result["errors"] += 1
+            if record_failure(consumer, change, e, max_attempts, feed_dir):
+                # Give up on this change so it can't hold the cursor back
+                print(f"[feed] !!! {consumer}: dead-lettered seq {change['seq']} "
+                      f"({change['url']}) after {max_attempts} failed runs")
+                result["dead_lettered"] += 1
+            elif not blocked:
+                # Snapshot replays share one seq, so step back below it
+                result["to_cursor"] = min(result["to_cursor"], change["seq"] - 1)
+                blocked = True
+
+        if not blocked:
+            result["to_cursor"] = change["seq"]
+
+    # Only advance past changes that went through (or were dead-lettered);
+    # replaying the rest is safe because consumers upsert by url
+    save_cursor(consumer, result["to_cursor"], feed_dir)
+    clear_failures(consumer, result["to_cursor"], feed_dir)
+    return result
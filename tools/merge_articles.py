@@ -8,6 +8,16 @@ from datetime import datetime
 from pathlib import Path
 import uuid
 
+try:
+    from tools.change_feed import OPS, load_state, append_changes
+except ImportError:
+    # Run directly as tools/merge_articles.py
+    from change_feed import OPS, load_state, append_changes
+
+# Fields compared to decide whether a known article changed.
+# scraped_at is excluded: it moves on every run.
+CONTENT_FIELDS = ("title", "url", "source", "published_date", "summary", "content")
+
 def load_json(filepath):
     """Load JSON file"""
     try:
@@ -20,6 +30,51 @@ def load_json(filepath):
         print(f"Error parsing {filepath}: {e}")
         return None
 
+def fill_missing(base, other):
+    """Return base with empty content fields filled in from other"""
+    merged = dict(base)
+    for field in CONTENT_FIELDS:
+        if not merged.get(field) and other.get(field):
+            merged[field] = other[field]
+    return merged
+
+def diff_against_state(articles, merged_urls, state):
+    """
+    Work out the change-log records for this run.
+
+    Returns (op, article) tuples: "insert" for unseen URLs, "update" when
+    the content of a known article changed, "merge" when a duplicate from
+    the other source only filled empty fields. Unchanged articles are
+    skipped. Known articles keep their existing id and source, whichever
+    newsletter the change came from; the record is written back into the
+    article so all_articles.json matches the feed.
+    """
+    changes = []
+    for article in articles:
+        url = article['url']
+        prev = state.get(url)
+        if prev is None:
+            changes.append(("insert", article))
+            continue
+
+        record = dict(prev)
+        for field in CONTENT_FIELDS:
+            if field != 'source' and article.get(field):
+                record[field] = article[field]
+        changed = [f for f in CONTENT_FIELDS if record.get(f) != prev.get(f)]
+
+        from_other_source = url in merged_urls or article.get('source') != prev.get('source')
+        if changed and from_other_source and all(not prev.get(f) for f in changed):
+            op = "merge"
+        else:
+            op = "update"
+
+        record['scraped_at'] = article.get('scraped_at')
+        if changed:
+            changes.append((op, record))
+        article.update(record)
+    return changes
+
 def merge_articles():
     """Merge articles from all sources"""
     print("[merge] Starting merge process...")
@@ -29,31 +84,50 @@ def merge_articles():
     airundown_data = load_json(".tmp/airundown_articles.json")
     
     all_articles = []
-    seen_urls = set()
+    by_url = {}
+    merged_urls = set()
     
     # Process Ben's Bites articles
     if bensbites_data and bensbites_data.get('articles'):
         for article in bensbites_data['articles']:
             url = article.get('url')
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                # Add unique ID and source
-                article['id'] = str(uuid.uuid4())
-                article['source'] = 'bens_bites'
-                article['scraped_at'] = bensbites_data.get('scrape_timestamp')
-                all_articles.append(article)
+            if not url:
+                continue
+            if url in by_url:
+                # Duplicate: fill gaps in the first copy instead of dropping it
+                first = by_url[url]
+                filled = fill_missing(first, article)
+                if filled != first:
+                    first.update(filled)
+                    merged_urls.add(url)
+                continue
+            # Add unique ID and source
+            article['id'] = str(uuid.uuid4())
+            article['source'] = 'bens_bites'
+            article['scraped_at'] = bensbites_data.get('scrape_timestamp')
+            by_url[url] = article
+            all_articles.append(article)
     
     # Process AI Rundown articles
     if airundown_data and airundown_data.get('articles'):
         for article in airundown_data['articles']:
             url = article.get('url')
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                # Add unique ID and source
-                article['id'] = str(uuid.uuid4())
-                article['source'] = 'ai_rundown'
-                article['scraped_at'] = airundown_data.get('scrape_timestamp')
-                all_articles.append(article)
+            if not url:
+                continue
+            if url in by_url:
+                # Duplicate: fill gaps in the first copy instead of dropping it
+                first = by_url[url]
+                filled = fill_missing(first, article)
+                if filled != first:
+                    first.update(filled)
+                    merged_urls.add(url)
+                continue
+            # Add unique ID and source
+            article['id'] = str(uuid.uuid4())
+            article['source'] = 'ai_rundown'
+            article['scraped_at'] = airundown_data.get('scrape_timestamp')
+            by_url[url] = article
+            all_articles.append(article)
     
     # Sort by published date (newest first)
     # Articles without dates go to the end
@@ -68,6 +142,14 @@ def merge_articles():
     
     all_articles.sort(key=sort_key, reverse=True)
     
+    # Append deltas to the change feed (oldest first so seq follows publish order)
+    changes = diff_against_state(all_articles, merged_urls, load_state(by_url))
+    changes.reverse()
+    last_seq = append_changes(changes)
+    counts = {op: sum(1 for c, _ in changes if c == op) for op in OPS}
+    print(f"[merge] Change feed: {counts['insert']} inserts, {counts['update']} updates, "
+          f"{counts['merge']} merges (seq {last_seq})")
+    
     # Calculate stats
     from datetime import timedelta
     now = datetime.now()
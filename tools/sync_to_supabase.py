@@ -1,13 +1,21 @@
 """
 Sync to Supabase
-Uploads merged articles to Supabase database
+Uploads article changes from the change feed to Supabase database
 """
 
-import json
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+try:
+    from tools.change_feed import consume
+except ImportError:
+    # Run directly as tools/sync_to_supabase.py
+    from change_feed import consume
+
+CONSUMER = "supabase_sync"
+MAX_SYNC_ATTEMPTS = 3  # Runs a change may fail before it is dead-lettered
+
 # Load environment variables
 load_dotenv()
 
@@ -22,54 +30,41 @@ if not url or not key:
 
 supabase: Client = create_client(url, key)
 
+def upsert_article(article):
+    """Upsert one article row into Supabase"""
+    # Prepare payload matches schema
+    payload = {
+        "title": article.get("title"),
+        "url": article.get("url"),
+        "source": article.get("source"),
+        "published_date": article.get("published_date"),
+        "summary": article.get("summary"),
+        "scraped_at": article.get("scraped_at")
+        # created_at is auto-generated
+    }
+    
+    # Upsert based on URL (unique constraint)
+    # usage: supabase.table("articles").upsert(payload, on_conflict="url").execute()
+    supabase.table("articles").upsert(
+        payload, 
+        on_conflict="url"
+    ).execute()
+
 def sync_articles():
-    """Sync articles from .tmp/all_articles.json to Supabase"""
+    """Sync changes since the last synced sequence number to Supabase"""
     print("[sync] Starting sync to Supabase...")
     
     try:
-        with open(".tmp/all_articles.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            articles = data.get("articles", [])
+        result = consume(CONSUMER, upsert_article, MAX_SYNC_ATTEMPTS)
             
-        if not articles:
-            print("[sync] No articles to sync")
+        if not result["changes"]:
+            print(f"[sync] No changes since seq {result['from_cursor']}")
             return
-
-        print(f"[sync] Found {len(articles)} articles to sync")
-        
-        count = 0
-        errors = 0
-        
-        for article in articles:
-            try:
-                # Prepare payload matches schema
-                payload = {
-                    "title": article.get("title"),
-                    "url": article.get("url"),
-                    "source": article.get("source"),
-                    "published_date": article.get("published_date"),
-                    "summary": article.get("summary"),
-                    "scraped_at": article.get("scraped_at")
-                    # created_at is auto-generated
-                }
-                
-                # Upsert based on URL (unique constraint)
-                # usage: supabase.table("articles").upsert(payload, on_conflict="url").execute()
-                response = supabase.table("articles").upsert(
-                    payload, 
-                    on_conflict="url"
-                ).execute()
-                
-                count += 1
-                
-            except Exception as e:
-                print(f"[sync] Error syncing article {article.get('url')}: {e}")
-                errors += 1
                 
-        print(f"[sync] Completed: {count} upserted, {errors} errors")
+        print(f"[sync] Completed: {result['applied']} upserted, {result['errors']} errors, "
+              f"{result['dead_lettered']} dead-lettered "
+              f"(cursor {result['from_cursor']} -> {result['to_cursor']}, head {result['head']})")
         
-    except FileNotFoundError:
-        print("[sync] .tmp/all_articles.json not found. Run scrapers first.")
     except Exception as e:
         print(f"[sync] Unexpected error: {e}")
 